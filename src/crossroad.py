@@ -1,14 +1,22 @@
 from kisim import Entity, Logger
 from graphics import *
+from export import ColumnStore, ResultCollector, car_records, light_records, draw_time_spent, render_plots
+from distributed import Coordinator, Job, run_worker
+from metrics import CellMetrics, draw_heatmaps, render_heatmaps
+from policies import (LightPolicy, LightState, PolicySpec, DemandSchedule, make_policy, parse_policy_specs, policy_registry,
+                      generate_demand, evaluate_policies, print_ranking)
+from runtime import AsyncRuntime, HeadlessFrontend, TkFrontend
 import simpy
 import random
 import numpy as np
 import matplotlib.pyplot as plt
-from matplotlib.ticker import MultipleLocator
 from enum import IntEnum
-from collections import defaultdict, Counter, OrderedDict
-from rich.progress import track
+from collections import deque
+from rich.progress import track, Progress
 import argparse
+import multiprocessing
+import os
+from array import array
 
 directions = ['N', 'E', 'S', 'W']
 start_pos = {'N': [0, 5], 'S': [11, 6], 'E': [5, 11], 'W': [6, 0]}
@@ -16,6 +24,8 @@ end_pos = {'N': [0, 6], 'S': [11, 5], 'E': [6, 11], 'W': [5, 0]}
 crossroad_entry = {'N': [4, 5], 'S': [7, 6], 'E': [5, 7], 'W': [6, 4]}
 turning_left_point = {'N': [6, 5], 'S': [5, 6], 'E': [5, 5], 'W': [6, 6]}
 turning_left = {'N': 'E', 'S': 'W', 'E': 'S', 'W': 'N'}
+left_of_entry = {'N': [1, 1], 'E': [1, -1], 'S': [-1, -1], 'W': [-1, 1]}
+crossing = {'N': 'EW', 'S': 'EW', 'E': 'NS', 'W': 'NS'}
 
 class TrafficLightType(IntEnum):
     RANDOM_WAIT_TIME = 0
@@ -24,33 +34,176 @@ class TrafficLightType(IntEnum):
     TIME_SPEND_PREFERRED = 3
 
 
+class RoadGrid:
+    """Flat 12x12 road grid with per-cell car data and occupancy bitmasks.
+
+    Attributes:
+        cars (array): Signed car id per cell, negative for cars turning left, 0 for a free cell.
+        targets (array): Index into ``directions`` of the target of the car in each cell, -1 for a free cell.
+        occupied (int): Bitmask of occupied cells, bit ``x * 12 + y`` for cell [x, y].
+        straight (int): Bitmask of cells occupied by cars that are not turning left.
+    """
+    size: int = 12
+
+    def __init__(self):
+        self.cars: array = array('i', [0] * self.size ** 2)
+        self.targets: array = array('b', [-1] * self.size ** 2)
+        self.occupied: int = 0
+        self.straight: int = 0
+
+    @classmethod
+    def cell(cls, pos: list[int]) -> int:
+        """Flat index of the cell [x, y]."""
+        return pos[0] * cls.size + pos[1]
+
+    @classmethod
+    def mask(cls, *cells: list[int]) -> int:
+        """Bitmask of the given cells."""
+        m = 0
+        for pos in cells:
+            m |= 1 << cls.cell(pos)
+        return m
+
+    def is_free(self, x: int, y: int) -> bool:
+        return not self.occupied >> (x * self.size + y) & 1
+
+    def occupy(self, x: int, y: int, car: 'Car') -> None:
+        """Marks the cell as occupied by the car."""
+        i = x * self.size + y
+        self.cars[i] = -car.id if car.turning_left else car.id
+        self.targets[i] = directions.index(car.target_loc)
+        self.occupied |= 1 << i
+        if not car.turning_left:
+            self.straight |= 1 << i
+
+    def release(self, x: int, y: int) -> None:
+        """Marks the cell as free."""
+        i = x * self.size + y
+        self.cars[i] = 0
+        self.targets[i] = -1
+        self.occupied &= ~(1 << i)
+        self.straight &= ~(1 << i)
+
+
+def _unit(from_loc: list[int], to_loc: list[int]) -> list[int]:
+    """Unit step along the longer axis from one location towards another."""
+    x = to_loc[0] - from_loc[0]
+    y = to_loc[1] - from_loc[1]
+    if abs(x) > abs(y):
+        return [1 if x > 0 else -1, y]
+    return [x, 1 if y > 0 else -1]
+
+
+def _conflict_lookups() -> tuple[dict[str, int], dict[str, int], dict[str, int]]:
+    """Precomputes cells checked by a car standing at the crossroad line of each approach.
+
+    Returns:
+        Tuple of dicts keyed by approach: bitmask of the oncoming lane a left turning car yields to,
+        bitmask of the cell two steps ahead, flat index of the cell diagonally to the left.
+    """
+    oncoming, ahead, left_cell = {}, {}, {}
+    for d in directions:
+        entry = crossroad_entry[d]
+        road_ahead = crossroad_entry[directions[directions.index(d) - 2]]
+        step = _unit(entry, road_ahead)
+        oncoming[d] = RoadGrid.mask(road_ahead, [road_ahead[0] + step[0], road_ahead[1] + step[1]])
+        forward = _unit(start_pos[d], entry)
+        ahead[d] = RoadGrid.mask([entry[0] + 2 * forward[0], entry[1] + 2 * forward[1]])
+        left_cell[d] = RoadGrid.cell([entry[0] + left_of_entry[d][0], entry[1] + left_of_entry[d][1]])
+    return oncoming, ahead, left_cell
+
+
+oncoming_lane_mask, two_ahead_mask, left_cell_index = _conflict_lookups()
+
+
+class ApproachQueue:
+    """Queue of cars arriving to the crossroad from one direction.
+
+    Only the car holding the spawn slot may enter the road, when it does the slot is handed
+    directly to the next waiting car.
+
+    Attributes:
+        waiting (deque[Car]): Cars waiting for the spawn slot in order of arrival.
+        holder (Car | None): Car holding the spawn slot.
+        in_queue (int): Count of cars that have not entered the road yet.
+        before_lights (int): Count of cars that have not passed the traffic lights yet.
+        not_crossed (int): Count of cars that have not crossed the crossroad line yet.
+        not_crossed_since (float): Sum of start times of those cars, their mean waiting time is kept without rescanning.
+    """
+
+    def __init__(self):
+        self.waiting: deque[Car] = deque()
+        self.holder: Car | None = None
+        self.in_queue: int = 0
+        self.before_lights: int = 0
+        self.not_crossed: int = 0
+        self.not_crossed_since: float = 0
+
+    def __len__(self) -> int:
+        return self.in_queue
+
+    def arrive(self, car: 'Car') -> bool:
+        """Registers an arriving car.
+
+        Returns:
+            bool - True if the car holds the spawn slot, otherwise it must wait for its spawn_event.
+        """
+        self.in_queue += 1
+        self.before_lights += 1
+        if self.holder is None:
+            self.holder = car
+            return True
+        self.waiting.append(car)
+        return False
+
+    def enter(self) -> None:
+        """Slot holder entered the road, hands the spawn slot to the next waiting car."""
+        self.in_queue -= 1
+        if self.waiting:
+            self.holder = self.waiting.popleft()
+            self.holder.spawn_event.succeed()
+        else:
+            self.holder = None
+
+    def pass_lights(self) -> None:
+        self.before_lights -= 1
+
+    def car_created(self, start_time: float) -> None:
+        self.not_crossed += 1
+        self.not_crossed_since += start_time
+
+    def car_crossed(self, start_time: float) -> None:
+        self.not_crossed -= 1
+        self.not_crossed_since -= start_time
+
+
 class Crossroad(Logger):
     """Simulation environment representing a crossroad.
 
     Attributes:
-        road (List[List[int]]): A 2D list representing the road where cars move. It tracks the positions of cars on the crossroad.
+        road (RoadGrid): Grid representing the road where cars move. It tracks the positions of cars on the crossroad.
         gr (Graphics): An instance of the graphics class representing the graphical environment.
         lights (Dict[str, str]): A dictionary representing the current state of traffic lights for each direction.
                                  Possible values are 'r' (red), 'g' (green), and 'o' (orange).
         lights_events (List[Event]): A list containing events for each traffic light to control their switching.
-        cars_spawn_queue (Dict[str, List[Car]]): A dictionary representing the queue of cars waiting to enter the crossroad for each direction.
+        approaches (Dict[str, ApproachQueue]): A dictionary representing the queue of cars waiting to enter the crossroad for each direction.
         cars (Dict[int, Car]): A dictionary containing instances of the Car class with their unique identifiers as keys.
-        cars_in_queue (Dict[str, int]): A dictionary representing the count of cars currently waiting in the queue for each direction.
-        cars_before_lights (Dict[str, int]): A dictionary representing the count of cars currently positioned before the traffic lights for each direction.
+        on_road (Dict[int, Car]): Cars that entered the road and did not finish yet.
+        lights_history (List[Tuple[float, str, str]]): Every light change as (time, direction, colour).
+        metrics (CellMetrics | None): Per-cell occupancy, wait and block metrics, collected only when set.
     """
      
     def __init__(self, graphics, factor=1.3, logEnabled=True):
         Logger.__init__(self, logEnabled)
-        self.road = [[0 for i in range(12)] for j in range(12)]  # represents environment where cars move
-        Logger.__init__(self, logEnabled)
-        self.road: list[list[int]] = [[0 for i in range(12)] for j in range(12)]  # represents environment where cars move
+        self.road: RoadGrid = RoadGrid()  # represents environment where cars move
         self.gr: Graphics = graphics
         self.lights: dict[str, str] = {'N': 'r', 'E': 'r', 'S': 'r', 'W': 'r'}
         self.lights_events: list = [self.event(), self.event()]
-        self.cars_spawn_queue: dict[str, list[Car]] = {'N': [], 'E': [], 'S': [], 'W': []}
+        self.approaches: dict[str, ApproachQueue] = {d: ApproachQueue() for d in directions}
         self.cars: dict[int, Car] = {}
-        self.cars_in_queue: dict[str, int] = {'N': 0, 'E': 0, 'S': 0, 'W': 0}
-        self.cars_before_lights: dict[str, int] = {'N': 0, 'E': 0, 'S': 0, 'W': 0}
+        self.on_road: dict[int, Car] = {}
+        self.lights_history: list[tuple[float, str, str]] = []
+        self.metrics: CellMetrics | None = None
 
 class RealtimeCrossroad(Crossroad, simpy.rt.RealtimeEnvironment, Logger):
     """A real-time simulation environment representing a crossroad.
@@ -93,11 +246,15 @@ class Car(Entity):
         self.target_loc: list[int, int] = target_loc
         self.speed: float = 0.4
         self.curr_pos: list[int] = [-1, -1]
+        self.next_pos: list[int] | None = None  # place the car is moving to
+        self.move_start: float = 0
         self.progress: float = 0
         self.turning_left: bool = turning_left[start] == target_loc
         self.start_time: float = self.env.now
         self.finish_time: float = -1
         self.spawn_event = self.env.event()
+        self.blocked: bool = False  # blocked at the crossroad line by the last free_to_go check
+        self.env.approaches[start].car_created(self.start_time)
 
     def find_targets(self) -> list[list[int]]:
         """Finds main target points that each car must pass through.
@@ -132,12 +289,18 @@ class Car(Entity):
         """
         direction = self.get_dir(self.curr_pos, target)
         while self.curr_pos != target:
+            next_pos = [self.curr_pos[0] + direction[0], self.curr_pos[1] + direction[1]]
             # Wait for free road
-            while self.env.road[self.curr_pos[0] + direction[0]][self.curr_pos[1] + direction[1]] != 0:
-                yield self.env.timeout(self.speed / 6)
+            if not self.env.road.is_free(next_pos[0], next_pos[1]):
+                wait_start = self.env.now
+                while not self.env.road.is_free(next_pos[0], next_pos[1]):
+                    yield self.env.timeout(self.speed / 6)
+                if self.env.metrics is not None:
+                    self.env.metrics.waited(RoadGrid.cell(next_pos), self.env.now - wait_start)
             # Move to next place on road
-            idx = -self.id if self.turning_left else self.id
-            self.env.road[self.curr_pos[0] + direction[0]][self.curr_pos[1] + direction[1]] = idx
+            self.occupy(next_pos)
+            self.next_pos = next_pos
+            self.move_start = self.env.now
 
             if isinstance(self.env, RealtimeCrossroad):
                 for i in range(30):
@@ -146,9 +309,10 @@ class Car(Entity):
             else:
                 yield self.env.timeout(self.speed)
 
-            self.env.road[self.curr_pos[0]][self.curr_pos[1]] = 0
+            self.release(self.curr_pos)
 
-            self.curr_pos = [self.curr_pos[0] + direction[0], self.curr_pos[1] + direction[1]]
+            self.curr_pos = self.next_pos
+            self.next_pos = None
             yield self.env.timeout(self.speed / 20)
 
     def lifetime(self) -> None:
@@ -163,47 +327,40 @@ class Car(Entity):
         self.log(f"I live! [from: {self.start}, to: {self.target_loc}]")
         s = start_pos[self.start]
 
-        self.env.cars_in_queue[self.start] += 1
-        self.env.cars_before_lights[self.start] += 1
+        queue = self.env.approaches[self.start]
+
+        has_slot = queue.arrive(self)
         if isinstance(self.env, RealtimeCrossroad):
-            self.env.gr.change_car_queue_text(self.start, len(self.env.cars_spawn_queue[self.start]))
+            self.env.gr.change_car_queue_text(self.start, len(queue))
 
-        if len(self.env.cars_spawn_queue[self.start]) > 1:
+        if not has_slot:
             yield self.spawn_event  # wait for free place in crossroads
         # 1. Get to the crossroads
-        while self.env.road[s[0]][s[1]] != 0:
-            yield self.env.timeout(self.speed / 2)  # else look for space
-        
-        self.env.cars_in_queue[self.start] -= 1
+        if not self.env.road.is_free(s[0], s[1]):
+            wait_start = self.env.now
+            while not self.env.road.is_free(s[0], s[1]):
+                yield self.env.timeout(self.speed / 2)  # else look for space
+            if self.env.metrics is not None:
+                self.env.metrics.waited(RoadGrid.cell(s), self.env.now - wait_start)
+
+        self.occupy(s)
+        self.curr_pos = s
+        self.env.on_road[self.id] = self
+        queue.enter()  # awake next car in queue
 
         if isinstance(self.env, RealtimeCrossroad):
             self.env.gr.display_car(self.start, "red", self.id, 'L' if self.turning_left else '')
-            text = self.env.cars_in_queue[self.start] if self.env.cars_in_queue[self.start] > 0 else self.start
-            self.env.gr.change_car_queue_text(self.start, text)
-
-        
-        self.env.road[s[0]][s[1]] = 1
-        self.curr_pos = s
+            self.env.gr.change_car_queue_text(self.start, len(queue) if len(queue) > 0 else self.start)
 
         t = self.find_targets()  # Find 3 targets the car go through
 
         self.progress += 1
 
-        # look to list and awake car 1. in queue
-        if len(self.env.cars_spawn_queue[self.start]) > 0:
-            c = self.env.cars_spawn_queue[self.start].pop(0)
-            if c is self and len(self.env.cars_spawn_queue[self.start]) > 0:
-                c = self.env.cars_spawn_queue[self.start].pop(0)
-            c.spawn_event.succeed()
-        else:
-            # if only one than remove self
-            if len(self.env.cars_spawn_queue[self.start]) > 0:
-                self.env.cars_spawn_queue[self.start].pop(0)
-
         # 2. Get to the crossroad line
         self.log(f"Going to crossroad line [from: {self.curr_pos}, to: {t[0]}]")
         yield self.env.process(self.drive(t[0]))
         self.log(f"At crossroad line: {self.curr_pos}")
+        line_arrival = self.env.now
 
         while not self.free_to_go():
             if self.env.lights[self.start] != 'g':
@@ -213,20 +370,39 @@ class Car(Entity):
         yield self.env.lights_events[directions.index(self.start) - 2]  # Wait if red light
 
         self.progress += 1
+        queue.car_crossed(self.start_time)
+        if self.env.metrics is not None and self.curr_pos != t[1]:
+            # waiting at the line is waiting to enter the first cell of the crossroad
+            direction = self.get_dir(self.curr_pos, t[1])
+            entry = [self.curr_pos[0] + direction[0], self.curr_pos[1] + direction[1]]
+            self.env.metrics.waited(RoadGrid.cell(entry), self.env.now - line_arrival)
         # 3. Check traffic rules and go to the middle of the crossroad
         yield self.env.process(self.drive(t[1]))
         self.log(f"At the middle of the crossroad: {self.curr_pos}")
-        self.env.cars_before_lights[self.start] -= 1
+        queue.pass_lights()
 
         # 4. Go to finish
         yield self.env.process(self.drive(t[2]))
         self.log(f"Finish! current_pos: {self.curr_pos}, end_loc: {end_pos[self.target_loc]}")
-        self.env.road[self.curr_pos[0]][self.curr_pos[1]] = 0
+        self.release(self.curr_pos)
         self.finish_time = self.env.now
+        del self.env.on_road[self.id]
         
         if isinstance(self.env, RealtimeCrossroad):
             self.env.gr.delete_car(self.id)
 
+    def occupy(self, pos: list[int]) -> None:
+        """Occupies place on the road, updates cell metrics if they are collected."""
+        self.env.road.occupy(pos[0], pos[1], self)
+        if self.env.metrics is not None:
+            self.env.metrics.occupy(RoadGrid.cell(pos), self.env.now)
+
+    def release(self, pos: list[int]) -> None:
+        """Frees place on the road, updates cell metrics if they are collected."""
+        self.env.road.release(pos[0], pos[1])
+        if self.env.metrics is not None:
+            self.env.metrics.release(RoadGrid.cell(pos), self.env.now)
+
     def get_dir(self, from_loc: list[int], to_loc: list[int]) -> list[int]:
         """Determines the direction from one location to another.
 
@@ -249,46 +425,46 @@ class Car(Entity):
 
     def free_to_go(self) -> bool:
         """Detects situation on the road if car is free to go.
+        Expects the car to stand at the crossroad line, conflicting cells are precomputed for each approach.
 
         Returns:
             bool - True if the road is free, False otherwise.
         """
         is_free = True
+        road = self.env.road
+        block_cell = -1
         if self.turning_left:  # Turning left so cars ahead have higher priority
-            road_ahead = crossroad_entry[directions[directions.index(self.start) - 2]]
-            x = road_ahead[0] - self.curr_pos[0]
-            y = road_ahead[1] - self.curr_pos[1]
-            if abs(x) > abs(y):
-                x = 1 if x > 0 else -1
-            else:
-                y = 1 if y > 0 else -1
-            if self.env.road[road_ahead[0]][road_ahead[1]] > 0 or self.env.road[road_ahead[0] + x][
-                road_ahead[1] + y] > 0:
+            blocking = road.straight & oncoming_lane_mask[self.start]
+            if blocking:
                 self.log(f"Turning left so must wait")
                 is_free = False
-            dir = self.get_dir(start_pos[self.start], self.curr_pos)
+                block_cell = (blocking & -blocking).bit_length() - 1
             # If car 2 steps ahead than wait
-            if self.env.road[2 * dir[0] + self.curr_pos[0]][2 * dir[1] + self.curr_pos[1]] != 0:
+            if road.occupied & two_ahead_mask[self.start]:
                 is_free = False
+                if block_cell < 0:
+                    block_cell = two_ahead_mask[self.start].bit_length() - 1
         else:
-            left = {'N': [1, 1], 'E': [1, -1], 'S': [-1, -1], 'W': [-1, 1]}
-            crossing = {'N': 'EW', 'S': 'EW', 'E': 'NS', 'W': 'NS'}
-            x = left[self.start][0] + self.curr_pos[0]
-            y = left[self.start][1] + self.curr_pos[1]
-            if self.env.road[x][y] < 0:
+            cell = left_cell_index[self.start]
+            if road.cars[cell] < 0:
                 is_free = False
-            elif self.env.road[x][y] != 0:
-                t_other = crossing[self.env.cars[self.env.road[x][y]].target_loc]
+            elif road.cars[cell] != 0:
+                t_other = crossing[directions[road.targets[cell]]]
                 if crossing[self.target_loc][0] == t_other or crossing[self.target_loc][1] == t_other:
                     is_free = False
+            block_cell = cell
 
+        # count each blocked episode once, not each check while it lasts
+        if not is_free and not self.blocked and self.env.metrics is not None:
+            self.env.metrics.block(block_cell)
+        self.blocked = not is_free
         return is_free
 
 
 class CarFactory(Entity):
     """Entity that creates cars."""
 
-    def __init__(self, env, exp_lambda, seed, simulation_len):
+    def __init__(self, env, exp_lambda, seed, simulation_len, schedule=None, limit_cars=True):
         """
         Initialize the CarFactory.
 
@@ -301,27 +477,38 @@ class CarFactory(Entity):
                 The seed for the random number generator.
             simulation_len: int
                 The total duration of the simulation.
+            schedule: DemandSchedule | None
+                Pre-generated arrivals to replay instead of drawing them.
+            limit_cars: bool
+                Stop after 0.8 cars per second of simulation_len, otherwise spawn until the simulation ends.
         """
         super().__init__(env)
         self.exp_lambda: float = exp_lambda
         self.simulation_len: int = simulation_len
         self.seed: int = seed
-        self.car_count: int = int(simulation_len * 0.8)
+        self.car_count: int | None = int(simulation_len * 0.8) if limit_cars else None
+        self.schedule: DemandSchedule | None = schedule
 
     def lifetime(self) -> None:
         """Spawns cars with exponential distributed time steps.
         Chooses uniformly where the car spawns and where is its finish.
         :return: None
         """
+        if self.schedule is not None:
+            for start, target_loc, gap in zip(self.schedule.starts, self.schedule.targets, self.schedule.gaps):
+                car = Car(self.env, directions[start], directions[target_loc])
+                self.env.cars[car.id] = car
+                yield self.env.timeout(gap)
+            return
+
         random.seed(self.seed)
         while True:
             start = random.randint(0, 3)
             target_loc = (start + random.randint(1, 3)) % 4
             car = Car(self.env, directions[start], directions[target_loc])
             self.env.cars[car.id] = car
-            self.env.cars_spawn_queue[directions[start]].append(car)
             yield self.env.timeout(random.expovariate(self.exp_lambda))
-            if len(self.env.cars) >= self.car_count:
+            if self.car_count is not None and len(self.env.cars) >= self.car_count:
                 break
 
 
@@ -336,96 +523,32 @@ class TrafficLights(Entity):
                 The simulation environment.
             gr: Graphics
                 An instance of the graphics class representing the graphical environment.
-            mode: TrafficLightType
-                The operation mode of the traffic lights.
+            mode: TrafficLightType | LightPolicy
+                The operation mode of the traffic lights or a policy controlling them.
         """
         super().__init__(env)
         self.gr: Graphics = gr
-        self.mode: TrafficLightType = mode
+        self.policy: LightPolicy = mode if isinstance(mode, LightPolicy) else make_policy(TrafficLightType(mode).name)
 
-    def get_wait_time(self) -> float:
-        """Chooses waiting time in order to operation mode.
-
-        Returns:
-            float: Waiting time.
-        """
-        if self.mode == TrafficLightType.RANDOM_WAIT_TIME:
-            return random.uniform(2, 9)
-        elif self.mode == TrafficLightType.STATIC_WAIT_TIME:
-            return 6
-        elif self.mode == TrafficLightType.COUNT_PREFERRED or self.mode == TrafficLightType.TIME_SPEND_PREFERRED:
-            return 0.5
-
-    def count_submeans(self) -> tuple[float, float]:
-        """Count waiting time mean for horizontal and vertical part of crossroad.
-
-        Returns:
-            Tuple[float, float]: Mean for North and South, mean for West and East part.
-        """
-        NS_mean = WE_mean = 0
-        NS_cars = WE_cars = 0
-        for c in self.env.cars.values():
-            if c.progress <= 1:
-                if c.start == 'N' or c.start == 'S':
-                    NS_cars += 1
-                    NS_mean += self.env.now - c.start_time
-                else:
-                    WE_cars += 1
-                    WE_mean += self.env.now - c.start_time
-
-        NS_mean = 0 if NS_cars == 0 else NS_mean / NS_cars
-        WE_mean = 0 if WE_cars == 0 else WE_mean / WE_cars
-
-        return NS_mean, WE_mean
+    def state(self) -> LightState:
+        return LightState(self.env.now, self.env.lights, self.env.approaches)
 
     def lifetime(self) -> None:
-        """Represents lifetime of traffic lights. Switches lights with given strategy.
-        Traffic lights strategy.
+        """Represents lifetime of traffic lights. Switches lights with decisions of the policy.
+        Built-in policies are registered under the names of TrafficLightType.
         0 - random switching time
         1 - static time
         2 - prefer horizontal/vertical lights where is more cars
         3 - prefer horizontal/vertical lights where is higher mean waiting time
         :return: None
         """
-        lights_idx = 0
-        c = 'g'
-        c1 = 'r'
         while True:
-
-            if self.mode == TrafficLightType.RANDOM_WAIT_TIME or self.mode == TrafficLightType.STATIC_WAIT_TIME:
-                lights_idx = random.randint(0, 1)
-                c = 'r' if random.randint(0, 1) == 0 else 'g'
-                c1 = 'g' if c == 'r' else 'r'
-                if c == self.env.lights[directions[lights_idx]]:
-                    c = 'g' if c != 'g' else 'r'
-                    c1 = 'g' if c == 'r' else 'r'
-            elif self.mode == TrafficLightType.COUNT_PREFERRED:
-                NS = self.env.cars_before_lights['N'] + self.env.cars_before_lights['S']
-                WE = self.env.cars_before_lights['W'] + self.env.cars_before_lights['E']
-                if abs(NS - WE) >= 6:
-                    lights_idx = 0 if NS > WE else 1
-                elif NS == 0 and WE != 0:
-                    lights_idx = 1
-                elif NS != 0 and WE == 0:
-                    lights_idx = 0
-
-                if c == self.env.lights[directions[lights_idx]]:
-                    yield self.env.timeout(self.get_wait_time() * 5)
-                    continue
-            elif self.mode == TrafficLightType.TIME_SPEND_PREFERRED:
-                NS = self.env.cars_before_lights['N'] + self.env.cars_before_lights['S']
-                WE = self.env.cars_before_lights['W'] + self.env.cars_before_lights['E']
-                NS_mean, WE_mean = self.count_submeans()
-                if abs(NS_mean - WE_mean) > (NS_mean + WE_mean) / 2 * 0.3:  # if diff between means is more than 20%
-                    lights_idx = 0 if NS_mean > WE_mean else 1
-                elif NS == 0 and WE != 0:
-                    lights_idx = 1
-                elif NS != 0 and WE == 0:
-                    lights_idx = 0
-
-                if c == self.env.lights[directions[lights_idx]]:
-                    yield self.env.timeout(self.get_wait_time() * 2)
-                    continue
+            decision = self.policy.decide(self.state())
+            if decision is None:
+                yield self.env.timeout(self.policy.check_time)
+                continue
+            lights_idx, c = decision
+            c1 = 'g' if c == 'r' else 'r'
 
             light1 = directions[lights_idx]
             light2 = directions[lights_idx - 2]
@@ -440,13 +563,20 @@ class TrafficLights(Entity):
             
             self.prepare_for_change(light1, light2, c, lights_idx)
             self.prepare_for_change(light3, light4, c1, lights_idx-1)
+            self.redraw()
 
             yield self.env.timeout(1.2)  # orange signalization
 
             self.change_lights(light1, light2, c, lights_idx)
             self.change_lights(light3, light4, c1, lights_idx - 1)
+            self.redraw()
+
+            yield self.env.timeout(self.policy.phase_time(self.state()))
 
-            yield self.env.timeout(self.get_wait_time())
+    def redraw(self) -> None:
+        """Draws lights of both axes at once, cars stopped at red lights would not redraw the canvas."""
+        if self.gr is not None:
+            self.gr.refresh(force=True)
 
     def prepare_for_change(self, light1: str, light2: str, c: str, lights_idx: int) -> None:
         """Prepares for light change - switches traffic lights to orange value
@@ -461,17 +591,19 @@ class TrafficLights(Entity):
         if c == 'r':
             self.env.lights_events[lights_idx] = self.env.event()
 
-        if gr is not None:
+        if self.gr is not None:
             if self.env.lights[light1] == 'r' and c == 'g':
-                gr.traffic_lights[light1].light(col='ro')
-                gr.traffic_lights[light2].light(col='ro')
+                self.gr.traffic_lights[light1].light(col='ro')
+                self.gr.traffic_lights[light2].light(col='ro')
             else:
-                gr.traffic_lights[light1].light(col='o')
-                gr.traffic_lights[light2].light(col='o')
+                self.gr.traffic_lights[light1].light(col='o')
+                self.gr.traffic_lights[light2].light(col='o')
 
         # Lights changes status, they turn to orange
         self.env.lights[light1] = 'o'
         self.env.lights[light2] = 'o'
+        self.env.lights_history.append((self.env.now, light1, 'o'))
+        self.env.lights_history.append((self.env.now, light2, 'o'))
 
     def change_lights(self, light1: str, light2: str, c: str, lights_idx: int) -> None:
         """Change lights color to red/green."""
@@ -483,10 +615,35 @@ class TrafficLights(Entity):
 
         self.env.lights[light1] = c
         self.env.lights[light2] = c
-        
-        if gr is not None:
-            gr.traffic_lights[light1].light(col=c)
-            gr.traffic_lights[light2].light(col=c)
+        self.env.lights_history.append((self.env.now, light1, c))
+        self.env.lights_history.append((self.env.now, light2, c))
+
+        if self.gr is not None:
+            self.gr.traffic_lights[light1].light(col=c)
+            self.gr.traffic_lights[light2].light(col=c)
+
+
+def simulate_job(job: Job) -> FastSimulatedCrossroad:
+    """Runs one round of statistical mode and returns the finished simulation."""
+    sim = FastSimulatedCrossroad(None, 0.25, logEnabled=False)
+    if job.heatmaps:
+        sim.metrics = CellMetrics(RoadGrid.size)
+    CarFactory(sim, job.exp_lambda, job.seed, job.simulation_len)
+    TrafficLights(sim, None, TrafficLightType(job.mode))
+    sim.run(job.simulation_len)
+    if sim.metrics is not None:
+        sim.metrics.close(sim.road.occupied, sim.now)
+    return sim
+
+
+def simulate_policy(spec: PolicySpec, schedule: DemandSchedule, simulation_len: float) -> FastSimulatedCrossroad:
+    """Runs the light policy against the demand schedule and returns the finished simulation."""
+    random.seed(schedule.seed)  # random decisions of the policy are reproducible too
+    sim = FastSimulatedCrossroad(None, 0.25, logEnabled=False)
+    CarFactory(sim, 2, schedule.seed, simulation_len, schedule=schedule)
+    TrafficLights(sim, None, make_policy(spec.name, **spec.params))
+    sim.run(simulation_len)
+    return sim
 
 
 if __name__ == '__main__':
@@ -499,6 +656,24 @@ if __name__ == '__main__':
                         help="Set the simulation time in seconds for statistical mode (default: 75 seconds).")
     parser.add_argument("-sn", "--stats-sim-rounds", dest="st_sim_rounds", type=int, default=300,
                         help="Set the number of simulation rounds for statistical mode (default: 300 rounds).")
+    parser.add_argument("-o", "--export-dir", dest="export_dir", type=str, default=None,
+                        help="Append per-car and light-phase results as .npy columns to this directory and render plots there instead of showing them.")
+    parser.add_argument("-hm", "--heatmaps", dest="heatmaps", action="store_true", default=False,
+                        help="Collect per-cell occupancy time, wait time and block counts of the road and plot them as heatmaps for each traffic lights mode.")
+    parser.add_argument("-co", "--coordinate", dest="coordinator_port", type=int, default=None,
+                        help="Hand out simulation rounds to workers connecting to this TCP port instead of running them locally (0 picks a free port).")
+    parser.add_argument("-lw", "--local-workers", dest="local_workers", type=int, default=0,
+                        help="Start this many worker processes on localhost for the coordinator (default: 0).")
+    parser.add_argument("-bs", "--batch-size", dest="batch_size", type=int, default=8,
+                        help="Set the number of simulation rounds handed out to a worker at once (default: 8).")
+    parser.add_argument("-wk", "--worker", dest="worker", type=str, default=None,
+                        help="Run as a worker for the coordinator at HOST:PORT and exit when it has no more work.")
+    parser.add_argument("-ev", "--evaluate", dest="evaluate", type=str, nargs='*', default=None,
+                        help="Rank light policies by mean delay and throughput over the same -sn demand schedules with arrivals during all -st seconds, unfinished cars count with delay until the end. Policies are given as NAME or 'NAME:param=v1,v2;other=v3' to sweep parameters, all registered policies by default.")
+    parser.add_argument("-er", "--evaluation-rate", dest="evaluation_rate", type=float, default=1,
+                        help="Set the arrival rate in cars per second of demand schedules for evaluating light policies (default: 1, close to the capacity of the crossroad).")
+    parser.add_argument("-pr", "--processes", dest="processes", type=int, default=None,
+                        help="Set the number of processes evaluating light policies (default: number of CPUs).")
 
     # Graphical mode options
     parser.add_argument("-gsl", "--graphical-sim-len", dest="gr_sim_len", type=int, default=30,
@@ -506,12 +681,49 @@ if __name__ == '__main__':
     parser.add_argument("-tl", "--traffic-light-mode", dest="traffic_light_mode", type=int, choices=[mode.value for mode in TrafficLightType],
                         default=TrafficLightType.TIME_SPEND_PREFERRED.value,
                         help="Set the traffic lights mode. Choose from: 0 (Random wait time), 1 (Static wait time 6 seconds), 2 (Car count preferred), 3 (Time spend preferred). Default is 3.")
+    parser.add_argument("-f", "--frontend", dest="frontend", type=str, choices=['tk', 'none'], default=None,
+                        help="Run graphical mode on the asyncio runtime with rendering decoupled from the simulation. 'tk' draws to a window, 'none' runs without display.")
+    parser.add_argument("-cp", "--control-port", dest="control_port", type=int, default=None,
+                        help="Serve a local control socket on this port in asyncio runtime (commands: 'mode <n>', 'policy <spec>', 'rate <lambda>', 'status').")
+    parser.add_argument("-mi", "--metrics-interval", dest="metrics_interval", type=float, default=5,
+                        help="Set the interval in seconds between printed live metrics in asyncio runtime (default: 5 seconds).")
     parser.add_argument("-seed", dest="random_seed", type=int, default=random.randint(0, 10000),
                     help="Set the seed value for random number generation to generate cars. Defaults to a random integer between 0 and 10000 if not provided.")
     
     args = parser.parse_args()
 
-    if not args.count_statistics:
+    if args.worker is not None:
+        host, port = args.worker.rsplit(':', 1)
+        count = run_worker(host, int(port), simulate_job)
+        print(f"Worker finished {count} simulation rounds")
+
+    elif args.evaluate is not None:
+        try:
+            specs = [spec for text in args.evaluate for spec in parse_policy_specs(text)]
+        except ValueError as e:
+            parser.error(str(e))
+        if not specs:
+            specs = [PolicySpec(name, {}) for name in policy_registry]
+        if not args.evaluation_rate > 0:
+            parser.error("evaluation rate must be positive")
+        schedules = [generate_demand(random.randint(0, args.st_sim_rounds ** 2), args.evaluation_rate, args.st_sim_len)
+                     for _ in range(args.st_sim_rounds)]
+        print_ranking(evaluate_policies(specs, schedules, args.st_sim_len, simulate_policy, args.processes))
+
+    elif not args.count_statistics and args.frontend is not None:
+        if args.frontend == 'tk':
+            gr = Graphics(tk.Tk(), size=50)
+            frontend = TkFrontend(gr, start_pos)
+        else:
+            frontend = HeadlessFrontend()
+        sim = FastSimulatedCrossroad(None, logEnabled=args.frontend != 'none')
+        # arrivals run until the end, so the 'rate' command changes the load instead of the length of the run
+        cf = CarFactory(sim, exp_lambda=2, seed=args.random_seed, simulation_len=args.gr_sim_len, limit_cars=False)
+        tl = TrafficLights(sim, None, mode=TrafficLightType(args.traffic_light_mode))
+        AsyncRuntime(sim, cf, tl, frontend, until=args.gr_sim_len, metrics_interval=args.metrics_interval,
+                     control_port=args.control_port, light_modes=TrafficLightType).run()
+
+    elif not args.count_statistics:
         window = tk.Tk()
         gr = Graphics(window, size=50)
         sim = RealtimeCrossroad(gr)
@@ -522,53 +734,65 @@ if __name__ == '__main__':
 
     elif args.count_statistics:
         # Comparison between traffic lights modes
-        gr = None
-        simulation_len = 75
-        counts = []
-        rounds = 500
+        simulation_len = args.st_sim_len
+        rounds = args.st_sim_rounds
         seeds = [random.randint(0, rounds ** 2) for _ in range(rounds)]
-        crossroad_time_spent = defaultdict(list)
-
-        for i in track(range(rounds), description="Running crossroad simulation"):
-            for mode in TrafficLightType:
-                sim = FastSimulatedCrossroad(gr, 0.25, logEnabled=False)
-                cf = CarFactory(sim, 2, seeds[i], simulation_len)
-                tl = TrafficLights(sim, gr, mode)
-
-                sim.run(simulation_len)
-                sorted_crossroad_times = sorted([car.finish_time - car.start_time for car in sim.cars.values() if car.finish_time > 0])
-                crossroad_time_spent[mode].extend(sorted_crossroad_times)
-
-        fig1, ax1 = plt.subplots()
-        fig2, ax2 = plt.subplots()
-        crossroad_time_spent_mean = defaultdict(list)
-        crossroad_time_spent_std = []
-        
-        for key, val in crossroad_time_spent.items():
-            sorted_finished_times = sorted(val)
-            counter = Counter(sorted_finished_times)
-            times_counts = list(counter.values())
-            cum_sum = np.cumsum(times_counts)
-            ax1.plot(list(OrderedDict.fromkeys(sorted_finished_times)), cum_sum / rounds, label=key.name)
-            crossroad_time_spent_mean[key.name] = np.mean(val)
-            crossroad_time_spent_std.append(np.std(val))
-        
-        # Plot for the first subplot
-        ax1.set_xlabel('Finish Time', fontsize=14)
-        ax1.set_ylabel('Finished cars', fontsize=14)
-        ax1.set_title('Cumulative time spent on crossroad', fontsize=20)
-        # Include grid settings for the first subplot
-        ax1.grid(True, linestyle='--', alpha=0.9, markevery=0.5)
-        ax1.legend()
-
-        # Plot mean time spent on crossroad
-        colormap =  plt.cm.cividis
-        ax2.bar(crossroad_time_spent_mean.keys(), crossroad_time_spent_mean.values(), yerr=crossroad_time_spent_std, ecolor="black", color=colormap(np.linspace(0, 1, len(crossroad_time_spent_mean.keys()))))
-        ax2.set_xlabel('Traffic lights mode', fontsize=15)
-        ax2.set_ylabel('Mean time', fontsize=15)
-        ax2.set_title('Mean time spent on crossroad', fontsize=20)
-        ax2.tick_params(axis='x', labelsize=12)
-        ax2.grid(True, linestyle='--', alpha=0.9, markevery=0.05)
-        ax2.yaxis.set_major_locator(MultipleLocator(4))
-
-        plt.show()
\ No newline at end of file
+        crossroad_time_spent = {mode.name: [] for mode in TrafficLightType}
+        store = ColumnStore(args.export_dir) if args.export_dir is not None else None
+        collector = ResultCollector()
+        round_offset = store.rounds if store is not None else 0
+        heatmaps = {mode.name: CellMetrics(RoadGrid.size) for mode in TrafficLightType}
+        jobs = [Job(i * len(TrafficLightType) + mode, round_offset + i, seeds[i], mode, simulation_len, 2, args.heatmaps)
+                for i in range(rounds) for mode in TrafficLightType]
+
+        def add_result(job: Job, cars: np.ndarray, lights: np.ndarray, metrics: CellMetrics | None) -> None:
+            if metrics is not None:
+                heatmaps[TrafficLightType(job.mode).name] += metrics
+            if store is not None:
+                collector.add_records(cars, lights, job.round, job.seed, job.mode)
+                if collector.rows >= 100000:
+                    collector.flush(store)
+            else:
+                finished = cars[cars['finish_time'] > 0]
+                crossroad_time_spent[TrafficLightType(job.mode).name].extend(finished['finish_time'] - finished['start_time'])
+
+        if args.coordinator_port is not None:
+            with Progress() as progress:
+                task = progress.add_task("Running crossroad simulation", total=len(jobs))
+
+                def on_result(job: Job, cars: np.ndarray, lights: np.ndarray, metrics: CellMetrics | None) -> None:
+                    add_result(job, cars, lights, metrics)
+                    progress.advance(task)
+
+                coordinator = Coordinator(jobs, on_result, port=args.coordinator_port, batch_size=args.batch_size)
+                progress.console.print(f"Coordinator listening on port {coordinator.port}")
+                workers = [multiprocessing.Process(target=run_worker, args=('127.0.0.1', coordinator.port, simulate_job))
+                           for _ in range(args.local_workers)]
+                for w in workers:
+                    w.start()
+                coordinator.run()
+                for w in workers:
+                    w.join()
+        else:
+            for job in track(jobs, description="Running crossroad simulation"):
+                sim = simulate_job(job)
+                add_result(job, car_records(sim), light_records(sim), sim.metrics)
+
+        if store is not None:
+            collector.flush(store)
+            store.add_rounds(rounds)
+            for path in render_plots(store, args.export_dir, {mode.value: mode.name for mode in TrafficLightType}):
+                print(f"Saved {path}")
+            if args.heatmaps:
+                for name, metrics in heatmaps.items():
+                    path = os.path.join(args.export_dir, f'heatmaps.{name}.npz')
+                    metrics.save(path)
+                    print(f"Saved {render_heatmaps(CellMetrics.load(path), os.path.join(args.export_dir, f'heatmaps_{name}.png'), name)}")
+        else:
+            fig1, ax1 = plt.subplots()
+            fig2, ax2 = plt.subplots()
+            draw_time_spent(ax1, ax2, crossroad_time_spent, rounds)
+            if args.heatmaps:
+                for name, metrics in heatmaps.items():
+                    draw_heatmaps(plt.figure(figsize=(15, 5)), metrics, name)
+            plt.show()
@@ -0,0 +1,292 @@
+import asyncio
+import socket
+import struct
+import time
+from collections import deque
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+from export import CAR_RECORD, LIGHT_RECORD, car_records, light_records
+from metrics import CellMetrics
+
+# Frames are: length of the rest (uint32), kind (1 byte), payload. All integers are big endian.
+FRAME = struct.Struct('!IB')
+BATCH = struct.Struct('!II')
+JOB = struct.Struct('!IIqBdd?')
+RESULT = struct.Struct('!III?')
+MAX_FRAME = 1 << 28  # larger frames are rejected, results of a batch are far smaller
+
+REQUEST = ord('R')  # worker asks for a batch
+JOBS = ord('B')  # coordinator sends a batch of jobs
+WAIT = ord('W')  # no batch now, some may be requeued, ask again later
+DONE = ord('D')  # all jobs finished, worker may exit
+RESULTS = ord('T')  # worker sends results of a batch
+
+
+class Job(NamedTuple):
+    """Single simulation run of a sweep."""
+    id: int
+    round: int
+    seed: int
+    mode: int
+    simulation_len: float
+    exp_lambda: float
+    heatmaps: bool = False
+
+
+class Batch:
+    """Jobs handed out to a worker together.
+
+    Attributes:
+        attempts (int): How many times the batch was handed out.
+        deadline (float): Time by which results must arrive, otherwise the batch is requeued.
+        owner (object): Connection of the worker running the batch.
+    """
+
+    def __init__(self, id: int, jobs: list[Job]):
+        self.id: int = id
+        self.jobs: list[Job] = jobs
+        self.attempts: int = 0
+        self.deadline: float = 0
+        self.owner = None
+
+
+def encode_batch(batch: Batch) -> bytes:
+    return BATCH.pack(batch.id, len(batch.jobs)) + b''.join(JOB.pack(*job) for job in batch.jobs)
+
+
+def decode_batch(payload: bytes) -> tuple[int, list[Job]]:
+    batch_id, count = BATCH.unpack_from(payload)
+    return batch_id, [Job(*JOB.unpack_from(payload, BATCH.size + i * JOB.size)) for i in range(count)]
+
+
+def encode_results(batch_id: int, results: list[tuple[int, np.ndarray, np.ndarray, CellMetrics | None]]) -> bytes:
+    parts = [BATCH.pack(batch_id, len(results))]
+    for job_id, cars, lights, metrics in results:
+        parts.append(RESULT.pack(job_id, len(cars), len(lights), metrics is not None))
+        parts.append(cars.tobytes())
+        parts.append(lights.tobytes())
+        if metrics is not None:
+            parts.append(metrics.to_bytes())
+    return b''.join(parts)
+
+
+def decode_results(payload: bytes) -> tuple[int, list[tuple[int, np.ndarray, np.ndarray, CellMetrics | None]]]:
+    batch_id, count = BATCH.unpack_from(payload)
+    offset = BATCH.size
+    results = []
+    for _ in range(count):
+        job_id, n_cars, n_lights, has_metrics = RESULT.unpack_from(payload, offset)
+        offset += RESULT.size
+        cars = np.frombuffer(payload, dtype=CAR_RECORD, count=n_cars, offset=offset)
+        offset += n_cars * CAR_RECORD.itemsize
+        lights = np.frombuffer(payload, dtype=LIGHT_RECORD, count=n_lights, offset=offset)
+        offset += n_lights * LIGHT_RECORD.itemsize
+        metrics = None
+        if has_metrics:
+            metrics = CellMetrics.from_bytes(payload[offset:offset + CellMetrics.byte_size()])
+            offset += CellMetrics.byte_size()
+        results.append((job_id, cars, lights, metrics))
+    return batch_id, results
+
+
+class Coordinator:
+    """Hands out batches of jobs to workers over TCP and collects their results.
+
+    Batches of a worker that disconnects or does not answer within the lease are requeued,
+    results of a job that arrive more than once are ignored. Workers sending malformed frames are dropped.
+
+    Attributes:
+        port (int): Port the coordinator listens on.
+        pending (deque[Batch]): Batches waiting for a worker.
+        in_flight (dict[int, Batch]): Batches handed out to workers.
+        finished (set[int]): Ids of jobs with results.
+        connections (dict[asyncio.StreamWriter, asyncio.Task]): Connected workers and tasks serving them.
+    """
+
+    def __init__(self, jobs: list[Job], on_result: Callable[[Job, np.ndarray, np.ndarray, CellMetrics | None], None],
+                 host: str = '0.0.0.0', port: int = 0, batch_size: int = 8, lease: float = 300,
+                 max_attempts: int = 3):
+        """
+        Initialize the Coordinator. The socket is bound immediately, so workers may be started before run().
+
+        Parameters:
+            jobs: list[Job]
+                Jobs to run.
+            on_result: Callable[[Job, np.ndarray, np.ndarray, CellMetrics | None], None]
+                Called once for each job with its CAR_RECORD and LIGHT_RECORD arrays and cell metrics if the job collected them.
+            lease: float
+                Seconds a worker has to return results of a batch.
+            max_attempts: int
+                How many times a batch is handed out before the run fails.
+        """
+        self.jobs: dict[int, Job] = {job.id: job for job in jobs}
+        self.on_result = on_result
+        self.lease: float = lease
+        self.max_attempts: int = max_attempts
+        self.pending: deque[Batch] = deque(Batch(i, jobs[j:j + batch_size])
+                                           for i, j in enumerate(range(0, len(jobs), batch_size)))
+        self.in_flight: dict[int, Batch] = {}
+        self.finished: set[int] = set()
+        self.connections: dict[asyncio.StreamWriter, asyncio.Task] = {}
+        self.sock: socket.socket = socket.create_server((host, port))
+        self.port: int = self.sock.getsockname()[1]
+        self.error: Exception | None = None
+
+    def run(self) -> None:
+        """Serves workers until results of all jobs arrive."""
+        asyncio.run(self.main())
+        if self.error is not None:
+            raise self.error
+
+    async def main(self) -> None:
+        self.done = asyncio.Event()
+        if len(self.finished) == len(self.jobs):
+            self.done.set()
+        server = await asyncio.start_server(self.handle_worker, sock=self.sock)
+        watcher = asyncio.create_task(self.watch_leases())
+        async with server:
+            await self.done.wait()
+        watcher.cancel()
+        # closed connection tells idle workers there is no more work
+        for writer in list(self.connections):
+            writer.close()
+        await asyncio.gather(*self.connections.values(), return_exceptions=True)
+
+    async def watch_leases(self) -> None:
+        while True:
+            await asyncio.sleep(min(self.lease, 1))
+            now = time.monotonic()
+            for batch in [b for b in self.in_flight.values() if b.deadline < now]:
+                self.requeue(batch)
+
+    def requeue(self, batch: Batch) -> None:
+        """Returns unfinished batch to the queue."""
+        if self.in_flight.pop(batch.id, None) is None:
+            return
+        if batch.attempts >= self.max_attempts:
+            self.error = RuntimeError(f"Batch {batch.id} failed {batch.attempts} times")
+            self.done.set()
+            return
+        batch.owner = None
+        self.pending.appendleft(batch)
+
+    def next_batch(self, owner) -> Batch | None:
+        while self.pending:
+            batch = self.pending.popleft()
+            if all(job.id in self.finished for job in batch.jobs):
+                continue  # finished meanwhile by a worker whose lease expired
+            batch.attempts += 1
+            batch.deadline = time.monotonic() + self.lease
+            batch.owner = owner
+            self.in_flight[batch.id] = batch
+            return batch
+        return None
+
+    def add_results(self, batch_id: int, results: list[tuple[int, np.ndarray, np.ndarray, CellMetrics | None]]) -> None:
+        for job_id, cars, lights, metrics in results:
+            if job_id in self.finished or job_id not in self.jobs:
+                continue
+            self.finished.add(job_id)
+            self.on_result(self.jobs[job_id], cars, lights, metrics)
+        self.in_flight.pop(batch_id, None)
+        if len(self.finished) == len(self.jobs):
+            self.done.set()
+
+    async def handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                length, kind = FRAME.unpack(await reader.readexactly(FRAME.size))
+                if not 1 <= length <= MAX_FRAME:
+                    break
+                payload = await reader.readexactly(length - 1)
+                if kind == RESULTS:
+                    try:
+                        results = decode_results(payload)
+                    except (struct.error, ValueError):
+                        break
+                    self.add_results(*results)
+                elif kind == REQUEST:
+                    if self.done.is_set():
+                        writer.write(FRAME.pack(1, DONE))
+                        await writer.drain()
+                        break
+                    batch = self.next_batch(writer)
+                    if batch is None:
+                        writer.write(FRAME.pack(1, WAIT))
+                    else:
+                        data = encode_batch(batch)
+                        writer.write(FRAME.pack(len(data) + 1, JOBS) + data)
+                    await writer.drain()
+                else:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self.connections[writer]
+            for batch in [b for b in self.in_flight.values() if b.owner is writer]:
+                self.requeue(batch)
+            writer.close()
+
+
+def _recv_frame(f) -> tuple[int, bytes]:
+    """Reads a frame from the connection, closed connection means there is no more work."""
+    header = f.read(FRAME.size)
+    if len(header) < FRAME.size:
+        return DONE, b''
+    length, kind = FRAME.unpack(header)
+    payload = f.read(length - 1)
+    if len(payload) < length - 1:
+        return DONE, b''
+    return kind, payload
+
+
+def run_worker(host: str, port: int, simulate: Callable[[Job], object], connect_timeout: float = 30,
+               wait_time: float = 0.5) -> int:
+    """Runs batches of jobs from the coordinator until it has no more work.
+
+    Parameters:
+        simulate: Callable[[Job], object]
+            Runs the job and returns the finished simulation environment.
+        connect_timeout: float
+            Seconds to keep retrying the connection while the coordinator starts.
+
+    Returns:
+        int: Number of jobs run.
+    """
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            sock = socket.create_connection((host, port))
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(wait_time)
+
+    count = 0
+    with sock, sock.makefile('rb') as f:
+        while True:
+            try:
+                sock.sendall(FRAME.pack(1, REQUEST))
+            except ConnectionError:
+                return count
+            kind, payload = _recv_frame(f)
+            if kind == DONE:
+                return count
+            if kind == WAIT:
+                time.sleep(wait_time)
+                continue
+            batch_id, jobs = decode_batch(payload)
+            results = []
+            for job in jobs:
+                sim = simulate(job)
+                results.append((job.id, car_records(sim), light_records(sim), sim.metrics))
+            data = encode_results(batch_id, results)
+            try:
+                sock.sendall(FRAME.pack(len(data) + 1, RESULTS) + data)
+            except ConnectionError:
+                return count
+            count += len(jobs)
@@ -0,0 +1,238 @@
+import json
+import os
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.ticker import MultipleLocator
+import matplotlib.cm as cm
+
+directions = ['N', 'E', 'S', 'W']
+light_colours = ['r', 'o', 'g']
+
+CAR_COLUMNS = {
+    'round': 'i4',
+    'seed': 'i8',
+    'mode': 'i1',
+    'car_id': 'i4',
+    'start': 'i1',
+    'target': 'i1',
+    'turning_left': '?',
+    'start_time': 'f8',
+    'finish_time': 'f8',
+}
+
+LIGHT_COLUMNS = {
+    'round': 'i4',
+    'seed': 'i8',
+    'mode': 'i1',
+    'time': 'f8',
+    'light': 'i1',
+    'colour': 'i1',
+}
+
+# Results of a single simulation run, little endian so they can be shipped between machines as bytes
+CAR_RECORD = np.dtype([('car_id', '<i4'), ('start', 'i1'), ('target', 'i1'), ('turning_left', '?'),
+                       ('start_time', '<f8'), ('finish_time', '<f8')])
+LIGHT_RECORD = np.dtype([('time', '<f8'), ('light', 'i1'), ('colour', 'i1')])
+
+NPY_HEADER_LEN = 128  # fixed so the row count can be rewritten in place on append
+
+
+def _npy_header(dtype: np.dtype, rows: int) -> bytes:
+    """Builds a fixed size .npy (version 1.0) header for a 1D column."""
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (dtype.str, rows)
+    header = header.ljust(NPY_HEADER_LEN - 10 - 1) + '\n'
+    return b'\x93NUMPY\x01\x00' + len(header).to_bytes(2, 'little') + header.encode('latin1')
+
+
+class ColumnStore:
+    """Directory of appendable, memory-mappable .npy columns described by a JSON manifest.
+
+    Attributes:
+        path (str): Directory holding the columns and ``manifest.json``.
+        manifest (dict): Tables with their columns, dtypes and row counts, plus code tables.
+    """
+
+    def __init__(self, path: str):
+        self.path: str = path
+        os.makedirs(path, exist_ok=True)
+        self.manifest: dict = {'rounds': 0, 'tables': {},
+                               'codes': {'directions': directions, 'colours': light_colours}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.path, 'manifest.json')
+
+    @property
+    def rounds(self) -> int:
+        """Number of simulation rounds already stored."""
+        return self.manifest['rounds']
+
+    def column_path(self, table: str, column: str) -> str:
+        return os.path.join(self.path, f'{table}.{column}.npy')
+
+    def create_table(self, table: str, schema: dict[str, str]) -> None:
+        """Creates empty columns for the table if it does not exist yet."""
+        if table in self.manifest['tables']:
+            return
+        for column, dtype in schema.items():
+            with open(self.column_path(table, column), 'wb') as f:
+                f.write(_npy_header(np.dtype(dtype), 0))
+        self.manifest['tables'][table] = {'rows': 0, 'columns': dict(schema)}
+        self.save_manifest()
+
+    def append(self, table: str, columns: dict[str, np.ndarray]) -> None:
+        """Appends rows to every column of the table.
+
+        Parameters:
+            table: str
+                Name of an existing table.
+            columns: dict[str, np.ndarray]
+                Values for each column of the table, all of the same length.
+        """
+        info = self.manifest['tables'][table]
+        lengths = {len(columns[c]) for c in info['columns']}
+        if len(lengths) != 1:
+            raise ValueError(f"Columns of table '{table}' differ in length: {lengths}")
+        count = lengths.pop()
+        if count == 0:
+            return
+
+        rows = info['rows'] + count
+        for column, dtype in info['columns'].items():
+            dtype = np.dtype(dtype)
+            with open(self.column_path(table, column), 'r+b') as f:
+                f.seek(0, os.SEEK_END)
+                f.write(np.ascontiguousarray(columns[column], dtype=dtype).tobytes())
+                f.seek(0)
+                f.write(_npy_header(dtype, rows))
+        info['rows'] = rows
+        self.save_manifest()
+
+    def load(self, table: str, mmap_mode: str | None = 'r') -> dict[str, np.ndarray]:
+        """Loads all columns of the table, memory mapped by default."""
+        return {column: np.load(self.column_path(table, column), mmap_mode=mmap_mode)
+                for column in self.manifest['tables'][table]['columns']}
+
+    def add_rounds(self, count: int) -> None:
+        self.manifest['rounds'] += count
+        self.save_manifest()
+
+    def save_manifest(self) -> None:
+        with open(self.manifest_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+
+
+def car_records(sim) -> np.ndarray:
+    """Per-car records of a finished simulation run."""
+    return np.array([(car.id, directions.index(car.start), directions.index(car.target_loc), car.turning_left,
+                      car.start_time, car.finish_time) for car in sim.cars.values()], dtype=CAR_RECORD)
+
+
+def light_records(sim) -> np.ndarray:
+    """Light-phase history of a finished simulation run."""
+    return np.array([(time, directions.index(light), light_colours.index(colour))
+                     for time, light, colour in sim.lights_history], dtype=LIGHT_RECORD)
+
+
+class ResultCollector:
+    """Collects per-car records and light-phase history of finished simulations into columns."""
+
+    def __init__(self):
+        self.chunks: dict[str, list[tuple[np.ndarray, int, int, int]]] = {}
+        self.rows: int = 0
+        self.clear()
+
+    def clear(self) -> None:
+        self.chunks = {'cars': [], 'lights': []}
+        self.rows = 0
+
+    def add_records(self, cars: np.ndarray, lights: np.ndarray, round_idx: int, seed: int, mode: int) -> None:
+        """Records results of one simulation run given as CAR_RECORD and LIGHT_RECORD arrays."""
+        self.chunks['cars'].append((cars, round_idx, seed, int(mode)))
+        self.chunks['lights'].append((lights, round_idx, seed, int(mode)))
+        self.rows += len(cars) + len(lights)
+
+    def columns(self, table: str, schema: dict[str, str]) -> dict[str, np.ndarray]:
+        """Builds columns of the table from collected records."""
+        chunks = self.chunks[table]
+        lengths = [len(records) for records, *_ in chunks]
+        columns = {
+            'round': np.repeat([c[1] for c in chunks], lengths).astype(schema['round']),
+            'seed': np.repeat([c[2] for c in chunks], lengths).astype(schema['seed']),
+            'mode': np.repeat([c[3] for c in chunks], lengths).astype(schema['mode']),
+        }
+        for column in schema:
+            if column not in columns:
+                columns[column] = np.concatenate([records[column] for records, *_ in chunks]) if chunks else []
+        return columns
+
+    def flush(self, store: ColumnStore) -> None:
+        """Appends collected rows to the store and clears the buffers."""
+        store.create_table('cars', CAR_COLUMNS)
+        store.create_table('lights', LIGHT_COLUMNS)
+        store.append('cars', self.columns('cars', CAR_COLUMNS))
+        store.append('lights', self.columns('lights', LIGHT_COLUMNS))
+        self.clear()
+
+
+def draw_time_spent(ax1, ax2, crossroad_time_spent: dict[str, np.ndarray], rounds: int) -> None:
+    """Draws cumulative and mean time spent on crossroad for each traffic lights mode."""
+    crossroad_time_spent_mean = {}
+    crossroad_time_spent_std = []
+
+    for key, val in crossroad_time_spent.items():
+        finished_times, times_counts = np.unique(val, return_counts=True)
+        ax1.plot(finished_times, np.cumsum(times_counts) / rounds, label=key)
+        crossroad_time_spent_mean[key] = np.mean(val)
+        crossroad_time_spent_std.append(np.std(val))
+
+    # Plot for the first subplot
+    ax1.set_xlabel('Finish Time', fontsize=14)
+    ax1.set_ylabel('Finished cars', fontsize=14)
+    ax1.set_title('Cumulative time spent on crossroad', fontsize=20)
+    # Include grid settings for the first subplot
+    ax1.grid(True, linestyle='--', alpha=0.9, markevery=0.5)
+    ax1.legend()
+
+    # Plot mean time spent on crossroad
+    colormap = cm.cividis
+    ax2.bar(crossroad_time_spent_mean.keys(), crossroad_time_spent_mean.values(), yerr=crossroad_time_spent_std,
+            ecolor="black", color=colormap(np.linspace(0, 1, len(crossroad_time_spent_mean.keys()))))
+    ax2.set_xlabel('Traffic lights mode', fontsize=15)
+    ax2.set_ylabel('Mean time', fontsize=15)
+    ax2.set_title('Mean time spent on crossroad', fontsize=20)
+    ax2.tick_params(axis='x', labelsize=12)
+    ax2.grid(True, linestyle='--', alpha=0.9, markevery=0.05)
+    ax2.yaxis.set_major_locator(MultipleLocator(4))
+
+
+def time_spent_by_mode(store: ColumnStore, mode_names: dict[int, str]) -> dict[str, np.ndarray]:
+    """Computes time spent on crossroad of finished cars for each mode straight from the columns."""
+    cars = store.load('cars')
+    finished = cars['finish_time'] > 0
+    spent = cars['finish_time'][finished] - cars['start_time'][finished]
+    modes = cars['mode'][finished]
+    return {name: spent[modes == value] for value, name in mode_names.items() if np.any(modes == value)}
+
+
+def render_plots(store: ColumnStore, out_dir: str, mode_names: dict[int, str]) -> list[str]:
+    """Renders plots of stored results to PNG files with the Agg backend.
+
+    Returns:
+        list[str]: Paths of the written files.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    fig1, fig2 = Figure(), Figure()
+    FigureCanvasAgg(fig1)
+    FigureCanvasAgg(fig2)
+    draw_time_spent(fig1.subplots(), fig2.subplots(), time_spent_by_mode(store, mode_names), max(store.rounds, 1))
+
+    paths = [os.path.join(out_dir, 'cumulative_time_spent.png'), os.path.join(out_dir, 'mean_time_spent.png')]
+    fig1.savefig(paths[0])
+    fig2.savefig(paths[1])
+    return paths
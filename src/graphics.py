@@ -1,9 +1,14 @@
+import time
 import tkinter as tk
 
 
 class Graphics:
-    """Visualize simulation."""
-    def __init__(self, window, size):
+    """Visualize simulation.
+
+    Car sprites are pre-created and reused, hidden cars return to the pool.
+    Redraws of the canvas are coalesced to at most one per frame.
+    """
+    def __init__(self, window, size, pool_size=64, fps=60):
         self.car_size = 0
         self.text_size = 0
         self.win = window
@@ -19,24 +24,63 @@ class Graphics:
         self.draw_crossroads(size)
         self.cars = {}
         self.car_labels = {}
+        self.car_pool = []
+        self.queue_texts = {}
+        self.frame_time = 1 / fps
+        self.last_update = 0
+        for _ in range(pool_size):
+            self.car_pool.append(self.create_car_sprite())
+
+    def create_car_sprite(self):
+        """Create hidden rectangle and label of the car, returns their item ids."""
+        rect = self.canvas.create_rectangle(0, 0, self.car_size, self.car_size, state='hidden')
+        label = self.canvas.create_text(0, 0, font=("Arial", int(0.6*self.text_size)), state='hidden')
+        return rect, label
+
+    def refresh(self, force=False):
+        """Redraw canvas, at most once per frame unless forced."""
+        now = time.monotonic()
+        if force or now - self.last_update >= self.frame_time:
+            self.last_update = now
+            self.canvas.update()
 
     def display_car(self, side, fill, id, text=''):
-        """Create, save and display graphical representation of the car."""
+        """Take car sprite from the pool, place it at the spawn point and display it."""
+        rect, label = self.car_pool.pop() if self.car_pool else self.create_car_sprite()
         x0, y0 = self.car_spawn_points[side]
-        self.cars[id] = self.canvas.create_rectangle(x0, y0, x0 + self.car_size, y0 + self.car_size, fill=fill, tags='car'+str(id))
-        self.car_labels[id] = self.canvas.create_text(x0+self.car_size/2, y0+self.car_size/2,
-                                                      font=("Arial", int(0.6*self.text_size)),text=str(id)+ f' {text}', tags='car'+str(id))
-        self.canvas.update()
+        self.canvas.coords(rect, x0, y0, x0 + self.car_size, y0 + self.car_size)
+        self.canvas.coords(label, x0+self.car_size/2, y0+self.car_size/2)
+        self.canvas.itemconfig(rect, fill=fill, state='normal')
+        self.canvas.itemconfig(label, text=str(id) + f' {text}', state='normal')
+        self.cars[id] = rect
+        self.car_labels[id] = label
+        self.refresh()
+
+    def place_car(self, id, side, rows, cols):
+        """Place graphical representation of the car, offset by given count of road cells from its spawn point."""
+        step = 1.58*self.size
+        x0 = self.car_spawn_points[side][0] + cols*step
+        y0 = self.car_spawn_points[side][1] + rows*step
+        self.canvas.coords(self.cars[id], x0, y0, x0 + self.car_size, y0 + self.car_size)
+        self.canvas.coords(self.car_labels[id], x0+self.car_size/2, y0+self.car_size/2)
 
     def change_car_queue_text(self, dir, count):
         """Changes text that represents number of waiting cars before crossroad."""
-        self.canvas.itemconfig(self.car_queue_text[dir], text=str(count))
-        self.canvas.update()
+        text = str(count)
+        if self.queue_texts.get(dir) == text:
+            return
+        self.queue_texts[dir] = text
+        self.canvas.itemconfig(self.car_queue_text[dir], text=text)
+        self.refresh()
 
     def delete_car(self, id):
-        """Delete graphical representation of the car (usually when in finish)"""
-        self.canvas.delete('car'+str(id))
-        self.canvas.update()
+        """Hide graphical representation of the car (usually when in finish) and return it to the pool."""
+        rect = self.cars.pop(id)
+        label = self.car_labels.pop(id)
+        self.canvas.itemconfig(rect, state='hidden')
+        self.canvas.itemconfig(label, state='hidden')
+        self.car_pool.append((rect, label))
+        self.refresh()
 
     def move_car(self, steps, direction, id):
         """Move graphical representation of the car."""
@@ -46,7 +90,7 @@ class Graphics:
         if self.cars[id] is not None:
             self.canvas.move(self.cars[id], speedX, speedY)
             self.canvas.move(self.car_labels[id], speedX, speedY)
-            self.canvas.update()
+            self.refresh()
 
     def draw_crossroads(self, size):
         """Counts ratio and draw crossroad and traffic lights."""
@@ -160,6 +204,7 @@ class TrafficLights:
         self.green_down = green_down
         self.curr_col = 'g'
         self.lights = []
+        self.fills = []
         self.light_pos = self.draw()
 
     def draw(self):
@@ -179,11 +224,12 @@ class TrafficLights:
                 self.lights.append(self.canvas.create_oval(x, y, x + self.light_size, y + self.light_size, fill="grey"))
             else:
                 self.lights.append(self.canvas.create_oval(x, y, x + self.light_size, y + self.light_size, fill="grey"))
+            self.fills.append("grey")
         self.canvas.update()
         return light_pos
 
     def light(self, col='r'):
-        """Light given color on traffic light."""
+        """Light given color on traffic light, only lamps that change are reconfigured."""
         if self.curr_col == col:
             return
 
@@ -192,20 +238,25 @@ class TrafficLights:
         else:
             col_idx = {'r': 2, 'o': 1, 'g': 0}
 
+        fills = list(self.fills)
         if col == 'ro':
-            self.canvas.itemconfig(self.lights[1], fill=self.cols['o'])
+            fills[1] = self.cols['o']
             col = col[1]
         else:
             idx = col_idx[col]
             if col == 'g':
-                self.canvas.itemconfig(self.lights[idx], fill=self.cols['g'])
-                self.canvas.itemconfig(self.lights[col_idx['r']], fill='grey')
-                self.canvas.itemconfig(self.lights[col_idx['o']], fill='grey')
+                fills[idx] = self.cols['g']
+                fills[col_idx['r']] = 'grey'
+                fills[col_idx['o']] = 'grey'
             elif col == 'o':
-                self.canvas.itemconfig(self.lights[idx], fill=self.cols['o'])
-                self.canvas.itemconfig(self.lights[col_idx['g']], fill='grey')
+                fills[idx] = self.cols['o']
+                fills[col_idx['g']] = 'grey'
             else:
-                self.canvas.itemconfig(self.lights[idx], fill=self.cols['r'])
-                self.canvas.itemconfig(self.lights[col_idx['o']], fill='grey')
+                fills[idx] = self.cols['r']
+                fills[col_idx['o']] = 'grey'
 
+        for lamp, old, new in zip(self.lights, self.fills, fills):
+            if old != new:
+                self.canvas.itemconfig(lamp, fill=new)
+        self.fills = fills
         self.curr_col = col
@@ -0,0 +1,115 @@
+import os
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+class CellMetrics:
+    """Per-cell occupancy time, wait time and block counts of the road grid.
+    Updated in O(1) on each occupy/release, merged across replications with ``+=``.
+
+    Attributes:
+        size (int): Side of the road grid.
+        replications (int): Number of simulation runs accumulated.
+        occupancy (np.ndarray): Total time each cell was occupied.
+        wait (np.ndarray): Total time cars waited to enter each cell, including waiting at the crossroad line.
+        entries (np.ndarray): Count of cars that entered each cell.
+        blocks (np.ndarray): Count of episodes in which each cell blocked a car at the crossroad line.
+    """
+    fields = ('occupancy', 'wait', 'entries', 'blocks')
+
+    def __init__(self, size: int = 12):
+        self.size: int = size
+        self.replications: int = 0
+        self.occupancy: np.ndarray = np.zeros(size * size, dtype='<f8')
+        self.wait: np.ndarray = np.zeros(size * size, dtype='<f8')
+        self.entries: np.ndarray = np.zeros(size * size, dtype='<i8')
+        self.blocks: np.ndarray = np.zeros(size * size, dtype='<i8')
+        self.since: np.ndarray = np.zeros(size * size, dtype='<f8')  # time each cell was occupied at
+
+    def occupy(self, cell: int, now: float) -> None:
+        self.since[cell] = now
+        self.entries[cell] += 1
+
+    def release(self, cell: int, now: float) -> None:
+        self.occupancy[cell] += now - self.since[cell]
+
+    def waited(self, cell: int, time: float) -> None:
+        self.wait[cell] += time
+
+    def block(self, cell: int) -> None:
+        self.blocks[cell] += 1
+
+    def close(self, occupied: int, now: float) -> None:
+        """Ends a replication, cells still occupied (bitmask) are counted as occupied until now."""
+        while occupied:
+            cell = (occupied & -occupied).bit_length() - 1
+            self.release(cell, now)
+            occupied &= occupied - 1
+        self.replications += 1
+
+    def __iadd__(self, other: 'CellMetrics') -> 'CellMetrics':
+        self.replications += other.replications
+        for f in self.fields:
+            getattr(self, f)[:] += getattr(other, f)
+        return self
+
+    def to_bytes(self) -> bytes:
+        return (np.array([self.replications], dtype='<i8').tobytes()
+                + b''.join(getattr(self, f).tobytes() for f in self.fields))
+
+    @classmethod
+    def byte_size(cls, size: int = 12) -> int:
+        return 8 * (1 + len(cls.fields) * size * size)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, size: int = 12) -> 'CellMetrics':
+        m = cls(size)
+        m.replications = int(np.frombuffer(data, dtype='<i8', count=1)[0])
+        for i, f in enumerate(cls.fields):
+            getattr(m, f)[:] = np.frombuffer(data, dtype=getattr(m, f).dtype, count=size * size, offset=8 + i * 8 * size * size)
+        return m
+
+    def save(self, path: str) -> None:
+        """Saves metrics, merging them with metrics already saved at the path."""
+        merged = CellMetrics.load(path) if os.path.exists(path) else CellMetrics(self.size)
+        merged += self
+        np.savez(path, replications=merged.replications, **{f: getattr(merged, f) for f in self.fields})
+
+    @classmethod
+    def load(cls, path: str) -> 'CellMetrics':
+        with np.load(path) as data:
+            m = cls(int(np.sqrt(len(data['occupancy']))))
+            m.replications = int(data['replications'])
+            for f in cls.fields:
+                getattr(m, f)[:] = data[f]
+        return m
+
+
+def draw_heatmaps(fig, metrics: CellMetrics, title: str = '') -> None:
+    """Draws mean occupancy time, mean wait per entry and blocks per replication of each cell."""
+    runs = max(metrics.replications, 1)
+    panels = [
+        ('Occupied time', metrics.occupancy / runs),
+        ('Wait per entry', metrics.wait / np.maximum(metrics.entries, 1)),
+        ('Blocks', metrics.blocks / runs),
+    ]
+    axes = fig.subplots(1, len(panels))
+    for ax, (name, values) in zip(axes, panels):
+        image = ax.imshow(values.reshape(metrics.size, metrics.size), cmap='inferno')
+        ax.set_title(name, fontsize=12)
+        ax.set_xticks(range(metrics.size))
+        ax.set_yticks(range(metrics.size))
+        ax.tick_params(labelsize=6)
+        fig.colorbar(image, ax=ax, fraction=0.046, pad=0.04)
+    fig.suptitle(title, fontsize=16)
+
+
+def render_heatmaps(metrics: CellMetrics, path: str, title: str = '') -> str:
+    """Renders heatmaps of the metrics to a PNG file with the Agg backend."""
+    fig = Figure(figsize=(15, 5))
+    FigureCanvasAgg(fig)
+    draw_heatmaps(fig, metrics, title)
+    fig.savefig(path)
+    return path
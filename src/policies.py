@@ -0,0 +1,290 @@
+import random
+from multiprocessing import Pool
+from typing import Callable, NamedTuple
+
+from rich.console import Console
+from rich.table import Table
+
+directions = ['N', 'E', 'S', 'W']
+axes = ['NS', 'EW']  # axis index is lights_idx, directions[idx] and directions[idx - 2] share the light
+
+
+class LightState:
+    """View of the crossroad given to light policies. All values are kept incrementally by the approach queues.
+
+    Attributes:
+        now (float): Current simulation time.
+        lights (dict[str, str]): Current phase, colour of each light ('r', 'o', 'g').
+    """
+
+    def __init__(self, now: float, lights: dict[str, str], approaches: dict):
+        self.now: float = now
+        self.lights: dict[str, str] = lights
+        self.approaches: dict = approaches
+
+    def before_lights(self, dirs: str) -> int:
+        """Count of cars that have not passed the traffic lights of the given directions."""
+        return sum(self.approaches[d].before_lights for d in dirs)
+
+    def mean_wait(self, dirs: str) -> float:
+        """Mean time spent by cars of the given directions that have not passed the crossroad line yet."""
+        count = sum(self.approaches[d].not_crossed for d in dirs)
+        if count == 0:
+            return 0
+        return sum(self.now * self.approaches[d].not_crossed - self.approaches[d].not_crossed_since for d in dirs) / count
+
+
+class LightPolicy:
+    """Controller of the traffic lights. Subclasses registered with ``register_policy`` can be selected by name.
+
+    Attributes:
+        name (str): Name the policy is registered under.
+        check_time (float): Time to wait before deciding again when the phase is kept.
+    """
+    name: str = ''
+    check_time: float = 1
+
+    def decide(self, state: LightState) -> tuple[int, str] | None:
+        """Chooses next phase.
+
+        Returns:
+            tuple[int, str] | None: Axis (0 - north/south, 1 - east/west) and its colour, the other axis gets the
+            opposite colour. None keeps the current phase.
+        """
+        raise NotImplementedError("abstract method")
+
+    def phase_time(self, state: LightState) -> float:
+        """How long a newly switched phase is held before deciding again."""
+        raise NotImplementedError("abstract method")
+
+
+def _positive(name: str, value: float) -> float:
+    """Checks time parameter of a policy, non-positive times would stall the simulation clock."""
+    if not value > 0:
+        raise ValueError(f"{name} must be positive, got {value}")
+    return value
+
+
+policy_registry: dict[str, type[LightPolicy]] = {}
+
+
+def register_policy(cls: type[LightPolicy]) -> type[LightPolicy]:
+    """Class decorator that makes the policy available by its name."""
+    policy_registry[cls.name] = cls
+    return cls
+
+
+def make_policy(name: str, **params) -> LightPolicy:
+    if name not in policy_registry:
+        raise ValueError(f"Unknown light policy '{name}', choose from: {', '.join(policy_registry)}")
+    return policy_registry[name](**params)
+
+
+@register_policy
+class RandomWaitTime(LightPolicy):
+    """Switches random axis to random colour and holds it for random time."""
+    name = 'RANDOM_WAIT_TIME'
+
+    def __init__(self, low: float = 2, high: float = 9):
+        self.low: float = _positive('low', low)
+        self.high: float = _positive('high', high)
+        if low > high:
+            raise ValueError(f"low must not be greater than high, got {low} > {high}")
+
+    def decide(self, state: LightState) -> tuple[int, str]:
+        lights_idx = random.randint(0, 1)
+        c = 'r' if random.randint(0, 1) == 0 else 'g'
+        if c == state.lights[directions[lights_idx]]:
+            c = 'g' if c != 'g' else 'r'
+        return lights_idx, c
+
+    def phase_time(self, state: LightState) -> float:
+        return random.uniform(self.low, self.high)
+
+
+@register_policy
+class StaticWaitTime(RandomWaitTime):
+    """Switches random axis to random colour and holds it for static time."""
+    name = 'STATIC_WAIT_TIME'
+
+    def __init__(self, wait: float = 6):
+        super().__init__()
+        self.wait: float = _positive('wait', wait)
+
+    def phase_time(self, state: LightState) -> float:
+        return self.wait
+
+
+@register_policy
+class CountPreferred(LightPolicy):
+    """Gives green to the axis with more cars before the lights."""
+    name = 'COUNT_PREFERRED'
+
+    def __init__(self, threshold: float = 6, check_time: float = 2.5, wait: float = 0.5):
+        self.threshold: float = threshold
+        self.check_time: float = _positive('check_time', check_time)
+        self.wait: float = _positive('wait', wait)
+        self.lights_idx: int = 0
+
+    def preferred(self, state: LightState, NS: int, WE: int) -> int | None:
+        if abs(NS - WE) >= self.threshold:
+            return 0 if NS > WE else 1
+        return None
+
+    def decide(self, state: LightState) -> tuple[int, str] | None:
+        NS = state.before_lights(axes[0])
+        WE = state.before_lights(axes[1])
+        preferred = self.preferred(state, NS, WE)
+        if preferred is not None:
+            self.lights_idx = preferred
+        elif NS == 0 and WE != 0:
+            self.lights_idx = 1
+        elif NS != 0 and WE == 0:
+            self.lights_idx = 0
+
+        if state.lights[directions[self.lights_idx]] == 'g':
+            return None
+        return self.lights_idx, 'g'
+
+    def phase_time(self, state: LightState) -> float:
+        return self.wait
+
+
+@register_policy
+class TimeSpendPreferred(CountPreferred):
+    """Gives green to the axis where cars wait longer on average."""
+    name = 'TIME_SPEND_PREFERRED'
+
+    def __init__(self, ratio: float = 0.3, check_time: float = 1, wait: float = 0.5):
+        super().__init__(check_time=check_time, wait=wait)
+        self.ratio: float = ratio
+
+    def preferred(self, state: LightState, NS: int, WE: int) -> int | None:
+        NS_mean = state.mean_wait(axes[0])
+        WE_mean = state.mean_wait(axes[1])
+        if abs(NS_mean - WE_mean) > (NS_mean + WE_mean) / 2 * self.ratio:
+            return 0 if NS_mean > WE_mean else 1
+        return None
+
+
+class PolicySpec(NamedTuple):
+    """Registered policy with parameters."""
+    name: str
+    params: dict
+
+    @property
+    def label(self) -> str:
+        if not self.params:
+            return self.name
+        return f"{self.name}({', '.join(f'{k}={v}' for k, v in self.params.items())})"
+
+
+def _parse_value(text: str) -> int | float:
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        raise ValueError(f"Invalid parameter value '{text}', expected a number") from None
+
+
+def parse_policy_specs(text: str) -> list[PolicySpec]:
+    """Parses 'NAME' or 'NAME:param=v1,v2;other=v3', every combination of listed values makes one spec."""
+    name, _, params = text.partition(':')
+    if name not in policy_registry:
+        raise ValueError(f"Unknown light policy '{name}', choose from: {', '.join(policy_registry)}")
+    specs = [PolicySpec(name, {})]
+    for param in filter(None, params.split(';')):
+        key, _, values = param.partition('=')
+        specs = [PolicySpec(name, {**s.params, key: _parse_value(v)}) for s in specs for v in values.split(',')]
+    for spec in specs:
+        try:
+            make_policy(spec.name, **spec.params)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid parameters of light policy '{spec.label}': {e}") from None
+    return specs
+
+
+class DemandSchedule(NamedTuple):
+    """Pre-generated car arrivals, replayed by CarFactory so every policy faces the same demand."""
+    seed: int
+    starts: list[int]
+    targets: list[int]
+    gaps: list[float]  # time to the next arrival
+
+
+def generate_demand(seed: int, exp_lambda: float, duration: float) -> DemandSchedule:
+    """Draws arrivals over the whole duration in the same order as CarFactory from its own generator.
+    The schedule matches a factory run with the same seed only under deterministic policies, random policies
+    share the global generator with CarFactory and interleave their draws with the arrivals.
+    """
+    rng = random.Random(seed)
+    starts, targets, gaps = [], [], []
+    time = 0
+    while time < duration:
+        start = rng.randint(0, 3)
+        starts.append(start)
+        targets.append((start + rng.randint(1, 3)) % 4)
+        gaps.append(rng.expovariate(exp_lambda))
+        time += gaps[-1]
+    return DemandSchedule(seed, starts, targets, gaps)
+
+
+class EvaluationResult(NamedTuple):
+    """Results of one policy over all demand schedules. Cars that did not finish count with delay until the end."""
+    spec: PolicySpec
+    cars: int
+    finished: int
+    throughput: float
+    mean_delay: float
+
+
+def _evaluate(args: tuple) -> tuple[int, int, int, float]:
+    simulate, spec_idx, spec, schedule, simulation_len = args
+    sim = simulate(spec, schedule, simulation_len)
+    finished = sum(c.finish_time > 0 for c in sim.cars.values())
+    delay = sum((c.finish_time if c.finish_time > 0 else simulation_len) - c.start_time for c in sim.cars.values())
+    return spec_idx, len(sim.cars), finished, delay
+
+
+def evaluate_policies(specs: list[PolicySpec], schedules: list, simulation_len: float,
+                      simulate: Callable, processes: int | None = None) -> list[EvaluationResult]:
+    """Runs every policy over the same demand schedules in parallel.
+
+    Parameters:
+        schedules: list[DemandSchedule]
+            Demand every policy is evaluated against.
+        simulate: Callable
+            Picklable function (spec, schedule, simulation_len) returning the finished simulation.
+        processes: int | None
+            Number of worker processes, defaults to the number of CPUs.
+
+    Returns:
+        list[EvaluationResult]: Results ranked by mean delay.
+    """
+    totals = [[0, 0, 0.0] for _ in specs]
+    tasks = [(simulate, i, spec, schedule, simulation_len) for i, spec in enumerate(specs) for schedule in schedules]
+    with Pool(processes) as pool:
+        for i, cars, finished, delay in pool.imap_unordered(_evaluate, tasks, chunksize=4):
+            totals[i][0] += cars
+            totals[i][1] += finished
+            totals[i][2] += delay
+
+    results = [EvaluationResult(spec, cars, finished, finished / (simulation_len * len(schedules)),
+                                delay / cars if cars else 0)
+               for spec, (cars, finished, delay) in zip(specs, totals)]
+    return sorted(results, key=lambda r: (r.mean_delay, -r.throughput))
+
+
+def print_ranking(results: list[EvaluationResult]) -> None:
+    """Prints results ranked by mean delay together with their throughput rank."""
+    throughput_rank = {r.spec.label: i + 1 for i, r in enumerate(sorted(results, key=lambda r: -r.throughput))}
+    table = Table(title="Traffic lights policies")
+    for column in ["Delay rank", "Policy", "Mean delay", "Throughput [cars/s]", "Throughput rank", "Finished cars"]:
+        table.add_column(column, overflow='fold')
+    for i, r in enumerate(results):
+        table.add_row(str(i + 1), r.spec.label, f"{r.mean_delay:.3f}", f"{r.throughput:.4f}",
+                      str(throughput_rank[r.spec.label]), f"{r.finished}/{r.cars}")
+    Console().print(table)
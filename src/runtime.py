@@ -0,0 +1,215 @@
+import asyncio
+import time
+import tkinter as tk
+
+from policies import make_policy, parse_policy_specs
+
+
+class Frontend:
+    """Presents state of a running simulation. Rendering is driven by the runtime, never by the simulation.
+
+    Attributes:
+        closed (bool): Set when the user closed the frontend, the runtime then stops.
+    """
+    closed: bool = False
+
+    def render(self, sim) -> None:
+        """Draw current state of the simulation."""
+
+    def close(self) -> None:
+        """Release resources of the frontend."""
+
+
+class HeadlessFrontend(Frontend):
+    """Frontend without display, for soak testing on headless servers."""
+
+
+class TkFrontend(Frontend):
+    """Frontend drawing the simulation state to the Tk canvas of Graphics.
+
+    Attributes:
+        gr (Graphics): Graphical environment to draw to.
+        start_pos (dict[str, list[int]]): Spawn cell of each direction, car sprites are placed relative to it.
+        shown (dict[int, Car]): Cars currently displayed.
+        lights (dict[str, str]): Last drawn colour of each traffic light.
+    """
+
+    def __init__(self, gr, start_pos: dict[str, list[int]]):
+        self.gr = gr
+        self.start_pos: dict[str, list[int]] = start_pos
+        self.shown: dict = {}
+        self.lights: dict[str, str] = {d: 'r' for d in start_pos}
+        gr.win.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_close(self) -> None:
+        self.closed = True
+
+    def render(self, sim) -> None:
+        for id in [id for id in self.shown if id not in sim.on_road]:
+            del self.shown[id]
+            self.gr.delete_car(id)
+
+        for id, car in sim.on_road.items():
+            if id not in self.shown:
+                self.shown[id] = car
+                self.gr.display_car(car.start, "red", id, 'L' if car.turning_left else '')
+            s = self.start_pos[car.start]
+            x, y = car.curr_pos
+            if car.next_pos is not None:
+                # interpolate between places on the road
+                progress = min(max((sim.now - car.move_start) / car.speed, 0), 1)
+                x += (car.next_pos[0] - x) * progress
+                y += (car.next_pos[1] - y) * progress
+            self.gr.place_car(id, car.start, x - s[0], y - s[1])
+
+        for d, queue in sim.approaches.items():
+            self.gr.change_car_queue_text(d, len(queue) if len(queue) > 0 else d)
+
+        for d, c in sim.lights.items():
+            if c != self.lights[d]:
+                self.gr.traffic_lights[d].light(col='ro' if self.lights[d] == 'r' and c == 'o' else c)
+                self.lights[d] = c
+
+        self.gr.refresh(force=True)
+
+    def close(self) -> None:
+        try:
+            self.gr.win.destroy()
+        except tk.TclError:
+            pass  # already destroyed
+
+
+class AsyncRuntime:
+    """Runs the simulation on wall-clock time in its own asyncio task.
+    Rendering, live metrics and the control socket are served by other tasks, so a slow frontend
+    does not stall the simulation, it only drops frames.
+
+    Attributes:
+        sim (Crossroad): Simulation environment, it must not draw anything itself.
+        factory (CarFactory): Car factory of the simulation, its arrival rate can be changed during the run.
+        lights (TrafficLights): Traffic lights of the simulation, their policy can be changed during the run.
+        frontend (Frontend): Frontend presenting the simulation.
+        until (float): Simulation time to run to.
+        factor (float): Wall-clock seconds per unit of simulation time.
+        lag (float): How far the simulation is behind wall-clock time, in simulation time units.
+    """
+
+    def __init__(self, sim, factory, lights, frontend: Frontend, until: float, factor: float = 1.3, fps: int = 30,
+                 metrics_interval: float | None = 5, control_port: int | None = None, light_modes=None):
+        """
+        Initialize the AsyncRuntime.
+
+        Parameters:
+            fps: int
+                Frames per second rendered by the frontend.
+            metrics_interval: float | None
+                Wall-clock seconds between printed metrics, None disables them.
+            control_port: int | None
+                Port of the local control socket, None disables it.
+            light_modes: type
+                Enum of traffic lights modes accepted by the 'mode' command of the control socket.
+        """
+        self.sim = sim
+        self.factory = factory
+        self.lights = lights
+        self.frontend: Frontend = frontend
+        self.until: float = until
+        self.factor: float = factor
+        self.frame_time: float = 1 / fps
+        self.metrics_interval: float | None = metrics_interval
+        self.control_port: int | None = control_port
+        self.light_modes = light_modes
+        self.lag: float = 0
+        self.tick: float = 0.005
+
+    def run(self) -> None:
+        asyncio.run(self.main())
+
+    async def main(self) -> None:
+        """Runs until the simulation ends, the frontend is closed or any of the tasks fails."""
+        tasks = [asyncio.create_task(self.simulate()), asyncio.create_task(self.render())]
+        if self.metrics_interval is not None:
+            tasks.append(asyncio.create_task(self.report_metrics()))
+        server = None
+        try:
+            if self.control_port is not None:
+                server = await asyncio.start_server(self.handle_control, '127.0.0.1', self.control_port)
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                t.result()  # raises exception of the failed task
+            if not self.frontend.closed:
+                self.frontend.render(self.sim)
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if server is not None:
+                server.close()
+                await server.wait_closed()
+            self.frontend.close()
+
+    async def simulate(self) -> None:
+        """Advances the simulation to the current wall-clock time, yielding to other tasks between steps."""
+        start = time.monotonic()
+        while self.sim.now < self.until:
+            target = min((time.monotonic() - start) / self.factor, self.until)
+            if target > self.sim.now:
+                self.sim.run(until=target)
+            self.lag = max((time.monotonic() - start) / self.factor - self.sim.now, 0)
+            await asyncio.sleep(self.tick)
+
+    async def render(self) -> None:
+        while not self.frontend.closed:
+            self.frontend.render(self.sim)
+            await asyncio.sleep(self.frame_time)
+
+    async def report_metrics(self) -> None:
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            print(self.metrics())
+
+    def metrics(self) -> str:
+        """Summary of the running simulation."""
+        finished = [c.finish_time - c.start_time for c in self.sim.cars.values() if c.finish_time > 0]
+        mean = sum(finished) / len(finished) if finished else 0
+        queues = ' '.join(f'{d}={len(q)}' for d, q in self.sim.approaches.items())
+        return (f"{self.sim.now:8.3f}  cars: {len(self.sim.cars)}, on road: {len(self.sim.on_road)}, "
+                f"finished: {len(finished)}, mean time: {mean:.2f}, queues: {queues}, "
+                f"policy: {self.lights.policy.name}, rate: {self.factory.exp_lambda}, lag: {self.lag:.3f}")
+
+    async def handle_control(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serves line based commands: 'mode <n>', 'policy <spec>', 'rate <lambda>', 'status'."""
+        try:
+            while line := await reader.readline():
+                writer.write((self.control(line.decode(errors='replace').split()) + '\n').encode())
+                await writer.drain()
+        except (ConnectionError, ValueError):  # client gone or line over the stream limit
+            pass
+        finally:
+            writer.close()
+
+    def control(self, command: list[str]) -> str:
+        """Executes control command and returns the reply."""
+        try:
+            if command[:1] == ['mode'] and len(command) == 2:
+                mode = int(command[1])
+                name = self.light_modes(mode).name if self.light_modes is not None else str(mode)
+                self.lights.policy = make_policy(name)
+                return f"ok mode {mode}"
+            elif command[:1] == ['policy'] and len(command) == 2:
+                specs = parse_policy_specs(command[1])
+                if len(specs) != 1:
+                    raise ValueError("policy takes single value of each parameter")
+                self.lights.policy = make_policy(specs[0].name, **specs[0].params)
+                return f"ok policy {specs[0].label}"
+            elif command[:1] == ['rate'] and len(command) == 2:
+                rate = float(command[1])
+                if rate <= 0:
+                    raise ValueError("rate must be positive")
+                self.factory.exp_lambda = rate
+                return f"ok rate {rate}"
+            elif command == ['status']:
+                return self.metrics()
+        except ValueError as e:
+            return f"error {e}"
+        return "error unknown command"